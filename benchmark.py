@@ -0,0 +1,466 @@
+# benchmarks for the hot paths in mal.py, run with `python benchmark.py <benchmark> [options]`. none of them need
+# network access, `offline` runs everything against local stand-ins for the MAL api and qBittorrent
+import argparse, ast, builtins, json, math, os, pickle, random, resource, subprocess, sys, tempfile, time, timeit, tracemalloc, urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+import mal
+
+DEMO_RESPONSE = "demo_response.json"
+
+
+def time_per_call(func, number: int) -> float:
+    # best of 5 runs, in microseconds per call
+    return min(timeit.repeat(func, number=number, repeat=5)) / number * 1_000_000
+
+
+def bench_json(args: argparse.Namespace) -> None:
+    with open(DEMO_RESPONSE, "rb") as f:
+        raw = f.read()
+    text = raw.decode()
+    print(f"Decoding {DEMO_RESPONSE} ({len(raw)} bytes), {args.number} iterations:")
+
+    # ast.literal_eval can't read json's true/false/null at all, so it only gets timed on a patched copy
+    try:
+        ast.literal_eval(text)
+    except ValueError:
+        print("  ast.literal_eval fails on the raw response, timing it on a copy with python literals instead")
+        text = text.replace("true", "True").replace("false", "False").replace("null", "None")
+    results = {"ast.literal_eval(str)": time_per_call(lambda: ast.literal_eval(text), args.number),
+               "json.loads(str)": time_per_call(lambda: json.loads(raw.decode()), args.number),
+               "json.loads(bytes)": time_per_call(lambda: json.loads(raw), args.number)}
+    try:
+        import orjson
+        results["orjson.loads(bytes)"] = time_per_call(lambda: orjson.loads(raw), args.number)
+    except ImportError:
+        print("  orjson not installed, skipping it")
+
+    baseline = results["ast.literal_eval(str)"]
+    for name, micros in results.items():
+        print(f"  {name:<24}{micros:>10.1f} us/call {baseline / micros:>8.1f}x")
+
+
+def fake_show_json(id: int, rng: 'random.Random | None' = None) -> dict:
+    # a response shaped like MAL.get_info's, with a realistic spread of genres and seasons. pass rng=random.Random(id)
+    # to get the same show every time
+    rng = random if rng is None else rng
+    genres = ["Action", "Adventure", "Comedy", "Drama", "Fantasy", "Romance", "Sci-Fi", "Slice of Life", "Sports", "Mystery"]
+    return {"id": id,
+            "title": f"Show {id}",
+            "alternative_titles": {"en": f"Show number {id}", "synonyms": [], "ja": ""},
+            "status": rng.choice(["finished_airing", "currently_airing", "not_yet_aired"]),
+            "num_episodes": rng.randint(1, 50),
+            "mean": round(rng.uniform(5, 9), 2),
+            "start_season": {"year": rng.randint(1990, 2025), "season": rng.choice(["winter", "spring", "summer", "fall"])},
+            "genres": [{"id": i, "name": genre} for i, genre in enumerate(rng.sample(genres, 3))],
+            "related_anime": []}
+
+
+def offline_mal() -> mal.MAL:
+    # a client that's only used for parsing, no token file and no network
+    return mal.MAL.__new__(mal.MAL)
+
+
+def bench_memory(args: argparse.Namespace) -> None:
+    client = offline_mal()
+    for size in args.sizes:
+        data = [fake_show_json(i) for i in range(size)]
+        tracemalloc.start()
+        shows = [mal.Show.from_json(i, client) for i in data]
+        show_bytes = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        pickled = sum(len(pickle.dumps(show, pickle.HIGHEST_PROTOCOL)) for show in shows)
+
+        start = time.perf_counter()
+        sorted(shows)
+        object_sort = time.perf_counter() - start
+        start = time.perf_counter()
+        mal.Show.sort(shows)
+        key_sort = time.perf_counter() - start
+
+        print(f"{size} shows:")
+        print(f"  Show objects      {show_bytes / 1024 / 1024:>8.2f} MB ({show_bytes / size:.0f} bytes/show)")
+        print(f"  pickled (per row) {pickled / 1024 / 1024:>8.2f} MB ({pickled / size:.0f} bytes/show)")
+        print(f"  sort              {object_sort * 1000:>8.1f} ms with Show.__lt__, {key_sort * 1000:.1f} ms with Show.sort")
+
+
+def time_command(command: 'list[str]', runs: int, cwd: 'str | None' = None) -> float:
+    # best wall time of a fresh process, in milliseconds
+    best = float("inf")
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(command, cwd=cwd, check=True, stdout=subprocess.DEVNULL)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def bench_startup(args: argparse.Namespace) -> None:
+    # also works as a regression check: exits with an error if importing mal.py got slow or eagerly imports
+    # modules that are supposed to be lazy
+    here = os.path.dirname(os.path.abspath(__file__))
+    interpreter = time_command([sys.executable, "-c", "pass"], args.runs)
+    imported = time_command([sys.executable, "-c", "import mal"], args.runs, here) - interpreter
+    with tempfile.TemporaryDirectory() as directory:
+        mal.ListStore(os.path.join(directory, mal.LIST_FILE)).close()     # `check` refuses to run without a list
+        check = time_command([sys.executable, os.path.join(here, "mal.py"), "check"], args.runs, directory) - interpreter
+    eager = subprocess.run([sys.executable, "-c", "import mal, sys; print(' '.join(i for i in ('urllib3', 'qbittorrentapi.client', '_pickle') if i in sys.modules))"],
+                           cwd=here, check=True, capture_output=True, text=True).stdout.split()
+    print(f"Startup, best of {args.runs} runs (not counting the interpreter's own {interpreter:.1f} ms):")
+    print(f"  import mal           {imported:>8.1f} ms")
+    print(f"  mal.py check         {check:>8.1f} ms (empty list)")
+    print(f"  imported eagerly     {', '.join(eager) if len(eager) > 0 else 'nothing heavy'}")
+    if imported > args.max_import_ms or len(eager) > 0:
+        sys.exit(f"Startup regression: import took {imported:.1f} ms (max {args.max_import_ms} ms), eagerly imported: {', '.join(eager) or 'nothing'}")
+
+
+def percentiles(values: 'list[float]', *ps: float) -> 'list[float]':
+    values = sorted(values)
+    return [values[min(len(values) - 1, int(len(values) * p / 100))] if len(values) > 0 else 0.0 for p in ps]
+
+
+class FakeMALHandler(BaseHTTPRequestHandler):
+    server: 'FakeMAL'
+    protocol_version = "HTTP/1.1"   # keep-alive, like the real api
+    disable_nagle_algorithm = True  # otherwise every response sits out a delayed ack, headers and body are written separately
+
+    def do_GET(self) -> None:
+        url = urllib.parse.urlparse(self.path)
+        params = {key: value[0] for key, value in urllib.parse.parse_qs(url.query).items()}
+        time.sleep(self.server.latency)
+        retry_after = self.server.admit()
+        if retry_after is not None:
+            self.reply(429, {"error": "too_many_requests"}, {"Retry-After": retry_after} if retry_after != "" else {})
+        elif url.path.startswith("/v2/anime/"):
+            self.reply(200, self.server.show(int(url.path.rpartition("/")[2]), params.get("fields", "")))
+        elif url.path == "/v2/anime":
+            self.reply(200, self.server.page(url.path, params, range(self.server.list_size), {"q": params.get("q", "")}))
+        elif url.path == "/v2/users/@me/animelist":
+            self.reply(200, self.server.page(url.path, params, range(self.server.list_size)))
+        else:
+            self.reply(404, {"error": "not_found"})
+
+    def reply(self, status: int, json_data: dict, headers: 'dict[str, str] | None' = None) -> None:
+        data = json.dumps(json_data).encode()
+        self.send_response(status)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format: str, *args) -> None:
+        pass
+
+
+class FakeMAL(ThreadingHTTPServer):
+    # stands in for api.myanimelist.net: every id is a show built from the demo_response.json fixture, the user's list
+    # is ids 0 to list_size - 1. requests over the rate limit and a random error_rate fraction get a 429
+    template: dict
+    list_size: int
+    latency: float          # seconds added to every response
+    rate: float             # requests per second allowed before answering with 429, 0 for no limit
+    burst: float
+    error_rate: float
+    tokens: float
+    updated: float
+    requests: int
+    throttled: int          # requests answered with 429
+    lock: Lock
+
+    def __init__(self, list_size: int = 0, latency: float = 0, rate: float = 0, burst: float = 10, error_rate: float = 0) -> None:
+        super().__init__(("127.0.0.1", 0), FakeMALHandler)
+        with open(DEMO_RESPONSE, "rb") as f:
+            self.template = json.load(f)
+        self.list_size = list_size
+        self.latency = latency
+        self.rate = rate
+        self.burst = burst
+        self.error_rate = error_rate
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.requests = 0
+        self.throttled = 0
+        self.lock = Lock()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_port}/v2"
+
+    def start(self) -> 'FakeMAL':
+        Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def admit(self) -> 'str | None':
+        # None if the request goes through, otherwise the Retry-After header to send ('' for none, like a random 429)
+        with self.lock:
+            self.requests += 1
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.rate > 0 and self.tokens < 1:
+                self.throttled += 1
+                return str(math.ceil((1 - self.tokens) / self.rate))
+            self.tokens -= 1
+            if random.random() < self.error_rate:
+                self.throttled += 1
+                return ""
+        return None
+
+    def show(self, id: int, fields: str = "") -> dict:
+        # the same id always gets the same show, so the list endpoint and the show endpoint agree with each other.
+        # like the real api, only id, title, main_picture and the requested fields are sent
+        show = {**self.template, **fake_show_json(id, random.Random(id))}
+        return {key: show[key] for key in ["id", "title", "main_picture", *fields.split(",")] if key in show}
+
+    def page(self, path: str, params: 'dict[str, str]', ids: range, extra: 'dict[str, str] | None' = None) -> dict:
+        limit = int(params.get("limit", 10))
+        offset = int(params.get("offset", 0))
+        out = {"data": [{"node": self.show(id, params.get("fields", ""))} for id in ids[offset:offset + limit]], "paging": {}}
+        if offset + limit < len(ids):
+            query = urllib.parse.urlencode({**(extra or {}), "fields": params.get("fields", ""), "limit": limit, "offset": offset + limit})
+            out["paging"]["next"] = f"{self.url}{path[3:]}?{query}"
+        return out
+
+
+class FakeQBittorrentHandler(BaseHTTPRequestHandler):
+    server: 'FakeQBittorrent'
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_GET(self) -> None:
+        self.do_POST()
+
+    def do_POST(self) -> None:
+        url = urllib.parse.urlparse(self.path)
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length).decode() if length > 0 else ""
+        params = {key: value[0] for key, value in urllib.parse.parse_qs(f"{url.query}&{body}").items()}
+        endpoint = url.path.removeprefix("/api/v2/")
+        if endpoint == "auth/login":
+            self.reply("Ok.", {"Set-Cookie": "SID=offline; path=/"})
+        elif endpoint == "app/version":
+            self.reply("v4.6.0")
+        elif endpoint == "app/webapiVersion":
+            self.reply("2.9.3")
+        elif endpoint == "search/start":
+            self.reply(self.server.start_job(params["pattern"]))
+        elif endpoint == "search/results":
+            self.reply(self.server.results(int(params["id"]), int(params.get("offset", 0))))
+        else:
+            self.reply("Ok.")    # search/stop, search/delete, torrents/add, auth/logout
+
+    def reply(self, data: 'str | dict', headers: 'dict[str, str] | None' = None) -> None:
+        raw = data.encode() if isinstance(data, str) else json.dumps(data).encode()
+        self.send_response(200)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header("Content-Type", "text/plain" if isinstance(data, str) else "application/json")
+        self.send_header("Content-Length", str(len(raw)))
+        self.end_headers()
+        self.wfile.write(raw)
+
+    def log_message(self, format: str, *args) -> None:
+        pass
+
+
+class FakeQBittorrent(ThreadingHTTPServer):
+    # stands in for qBittorrent's web api search endpoints, every search finds `results` torrents spread evenly over
+    # `duration` seconds
+    results_per_search: int
+    duration: float
+    jobs: 'dict[int, tuple[float, str]]'    # job id -> (start time, query)
+    lock: Lock
+
+    def __init__(self, results: int = 200, duration: float = 0.5) -> None:
+        super().__init__(("127.0.0.1", 0), FakeQBittorrentHandler)
+        self.results_per_search = results
+        self.duration = duration
+        self.jobs = {}
+        self.lock = Lock()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_port}"
+
+    def start(self) -> 'FakeQBittorrent':
+        Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def start_job(self, query: str) -> dict:
+        with self.lock:
+            id = len(self.jobs)
+            self.jobs[id] = (time.monotonic(), query)
+        return {"id": id}
+
+    def results(self, id: int, offset: int) -> dict:
+        start, query = self.jobs[id]
+        progress = min(1.0, (time.monotonic() - start) / self.duration) if self.duration > 0 else 1.0
+        found = int(self.results_per_search * progress)
+        return {"status": "Running" if progress < 1 else "Stopped", "total": found,
+                "results": [{"fileName": f"[Group{i % 7}] {query} - {i:03} [1080p]", "fileUrl": f"magnet:?xt=urn:btih:{id:020x}{i:020x}",
+                             "fileSize": 300_000_000 + i * 1_000_003, "nbSeeders": (i * 37) % 500, "nbLeechers": i % 50,
+                             "siteUrl": "https://nyaa.si", "descrLink": f"https://nyaa.si/view/{id}-{i}"} for i in range(offset, found)]}
+
+
+def offline_client(server: FakeMAL, directory: str, rate: float, cache_file: 'str | None' = None) -> mal.MAL:
+    # a real MAL client pointed at the fake api, with a response cache in directory if cache_file is given
+    token_file = os.path.join(directory, "token.json")
+    with open(token_file, "w") as f:
+        json.dump({"access_token": "offline", "refresh_token": "offline"}, f)
+    client = mal.MAL(token_file, cache=mal.ResponseCache(os.path.join(directory, cache_file)) if cache_file is not None else None)
+    client.API_URL = server.url
+    if rate > 0:
+        client.limiter = mal.RateLimiter(rate, client.burst)
+    return client
+
+
+def time_search_list(main: mal.Main, queries: 'list[str]', rounds: int) -> 'list[float]':
+    # search_list reads the query with input(), so feed it ours
+    latencies = []
+    original = builtins.input
+    try:
+        for query in queries * rounds:
+            builtins.input = lambda prompt="", query=query: query
+            start = time.perf_counter()
+            main.search_list()
+            latencies.append(time.perf_counter() - start)
+    finally:
+        builtins.input = original
+    return latencies
+
+
+def bench_offline_size(args: argparse.Namespace, server: FakeMAL, size: int, directory: str) -> dict:
+    server.list_size = size
+    data = [server.show(i, mal.MAL.FIELDS) for i in range(size)]
+    results = {"size": size}
+
+    client = offline_client(server, directory, args.client_rate)
+    start = time.perf_counter()
+    shows = [mal.Show.from_json(i, client) for i in data]
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()     # slows everything down, so memory gets measured on a second run
+    copies = [mal.Show.from_json(i, client) for i in data]
+    results["build"] = {"shows_per_s": size / elapsed, "mb": tracemalloc.get_traced_memory()[0] / 1024 / 1024}
+    tracemalloc.stop()
+    del data, copies
+
+    # a cold fetch through the api, then the same shows again from the response cache
+    client = offline_client(server, directory, args.client_rate, f"response_cache_{size}.db")
+    ids = list(range(min(size, args.fetch)))
+    for name in ("fetch", "fetch_cached"):
+        throttled = server.throttled
+        refresher = mal.Refresher(client)
+        refresher.get(ids)
+        p50, p95, p99 = percentiles(refresher.latencies, 50, 95, 99)
+        results[name] = {"shows": len(ids), "shows_per_s": len(refresher.latencies) / refresher.elapsed, "p50_ms": p50 * 1000,
+                         "p95_ms": p95 * 1000, "p99_ms": p99 * 1000, "failed": len(refresher.failed), "throttled": server.throttled - throttled}
+
+    store = mal.ListStore(os.path.join(directory, f"list_{size}.db"))
+    store.save(shows)
+    store.close()
+    del shows
+    tracemalloc.start()     # Main loads the list as part of starting up
+    main = mal.Main(os.path.join(directory, f"list_{size}.db"), client, os.path.join(directory, "cache.bin"), qbittorrent=False, quiet=True)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    start = time.perf_counter()
+    main.load_list()
+    results["load_list"] = {"ms": (time.perf_counter() - start) * 1000, "peak_mb": peak / 1024 / 1024}
+
+    queries = ["Show 7", "show number 42", "genre:action", "season:spring 2020", "genre:comedy season:fall", "shwo numbr 1"]
+    latencies = time_search_list(main, queries, args.rounds)
+    p50, p95, p99 = percentiles(latencies, 50, 95, 99)
+    results["search_list"] = {"queries_per_s": len(latencies) / sum(latencies), "p50_ms": p50 * 1000, "p95_ms": p95 * 1000, "p99_ms": p99 * 1000}
+
+    # pulls the whole list from the fake api in pages of 1000 and compares it against ours
+    start = time.perf_counter()
+    stale = main.find_stale()
+    results["find_stale"] = {"ms": (time.perf_counter() - start) * 1000, "stale": len(stale)}
+    main.store.close()
+    return results
+
+
+def bench_torrents(args: argparse.Namespace) -> dict:
+    # the same concurrent search and ranking as Main.batch_search_qbittorrent, timing every search
+    server = FakeQBittorrent(args.torrent_results, args.torrent_duration).start()
+    client = mal.qbittorrentapi.Client(host=server.url, username="offline", password="offline")
+    client.auth_log_in()
+
+    def search(i: int) -> float:
+        start = time.perf_counter()
+        ranker = mal.TorrentRanker(3, [mal.TorrentRanker.seeders, mal.TorrentRanker.size])
+        for batch in mal.TorrentSearch(client, f"Show {i}", "nyaasi", "anime").results():
+            ranker.add(batch)
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(5) as pool:
+        latencies = list(pool.map(search, range(args.searches)))
+    elapsed = time.perf_counter() - start
+    server.shutdown()
+    p50, p95, p99 = percentiles(latencies, 50, 95, 99)
+    return {"searches": args.searches, "searches_per_s": args.searches / elapsed, "results_per_s": args.searches * args.torrent_results / elapsed,
+            "p50_ms": p50 * 1000, "p95_ms": p95 * 1000, "p99_ms": p99 * 1000}
+
+
+def bench_offline(args: argparse.Namespace) -> None:
+    server = FakeMAL(0, args.latency / 1000, args.rate, args.burst, args.error_rate).start()
+    print_json = lambda results: print(json.dumps(results), flush=True)
+    with tempfile.TemporaryDirectory() as directory:
+        for size in args.sizes:
+            results = bench_offline_size(args, server, size, directory)
+            if args.json:
+                print_json(results)
+                continue
+            print(f"{size} shows:")
+            print(f"  Show.from_json    {results['build']['shows_per_s']:>10.0f} shows/s, {results['build']['mb']:.2f} MB")
+            for name in ("fetch", "fetch_cached"):
+                i = results[name]
+                print(f"  {'fetch (cached)' if name == 'fetch_cached' else 'fetch (api)':<17} {i['shows_per_s']:>10.1f} shows/s over {i['shows']} shows | "
+                      f"p50 {i['p50_ms']:.1f}ms, p95 {i['p95_ms']:.1f}ms, p99 {i['p99_ms']:.1f}ms | {i['throttled']} 429s, {i['failed']} failed")
+            print(f"  Main.load_list    {results['load_list']['ms']:>10.1f} ms, {results['load_list']['peak_mb']:.2f} MB peak")
+            i = results["search_list"]
+            print(f"  search_list       {i['queries_per_s']:>10.0f} queries/s | p50 {i['p50_ms']:.2f}ms, p95 {i['p95_ms']:.2f}ms, p99 {i['p99_ms']:.2f}ms")
+            print(f"  find_stale        {results['find_stale']['ms']:>10.1f} ms ({results['find_stale']['stale']} stale)")
+    server.shutdown()
+    if args.searches > 0:
+        i = bench_torrents(args)
+        if args.json:
+            print_json({"torrents": i})
+        else:
+            print(f"Torrent search ({i['searches']} searches, 5 at a time):")
+            print(f"  {i['searches_per_s']:.1f} searches/s, {i['results_per_s']:.0f} results/s | p50 {i['p50_ms']:.0f}ms, p95 {i['p95_ms']:.0f}ms, p99 {i['p99_ms']:.0f}ms")
+    if not args.json:
+        print(f"Max RSS: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MB")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks for mal.py")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+    parser_json = subparsers.add_parser("json", help="response decoding: ast.literal_eval vs json vs orjson")
+    parser_json.add_argument("-n", "--number", type=int, default=2000, help="calls per timing run")
+    parser_json.set_defaults(func=bench_json)
+    parser_memory = subparsers.add_parser("memory", help="memory and pickle size of Show records, and sorting them")
+    parser_memory.add_argument("sizes", type=int, nargs="*", default=[10_000, 100_000], help="list sizes to measure")
+    parser_memory.set_defaults(func=bench_memory)
+    parser_startup = subparsers.add_parser("startup", help="import and one-shot command startup time, fails if importing got slow")
+    parser_startup.add_argument("-r", "--runs", type=int, default=10, help="processes to start per measurement")
+    parser_startup.add_argument("--max-import-ms", type=float, default=100, help="fail if importing mal.py takes longer than this")
+    parser_startup.set_defaults(func=bench_startup)
+    parser_offline = subparsers.add_parser("offline", help="fetching, loading and searching the list and torrent search, against local stand-ins for MAL and qBittorrent")
+    parser_offline.add_argument("sizes", type=int, nargs="*", default=[10, 100, 1000, 10_000, 100_000], help="list sizes to measure")
+    parser_offline.add_argument("--fetch", type=int, default=200, help="max shows fetched through the api per list size")
+    parser_offline.add_argument("--latency", type=float, default=20, help="ms the fake api takes to answer")
+    parser_offline.add_argument("--rate", type=float, default=100, help="requests/s the fake api allows before answering 429, 0 for no limit")
+    parser_offline.add_argument("--burst", type=float, default=10, help="requests the fake api allows back to back")
+    parser_offline.add_argument("--error-rate", type=float, default=0.01, help="fraction of requests that randomly get a 429")
+    parser_offline.add_argument("--client-rate", type=float, default=80, help="requests/s for the client's own rate limiter, 0 keeps the real one")
+    parser_offline.add_argument("--rounds", type=int, default=20, help="times each search_list query is run")
+    parser_offline.add_argument("--searches", type=int, default=10, help="torrent searches to run, 0 to skip them")
+    parser_offline.add_argument("--torrent-results", type=int, default=200, help="results per torrent search")
+    parser_offline.add_argument("--torrent-duration", type=float, default=0.5, help="seconds each torrent search takes")
+    parser_offline.add_argument("--json", action="store_true", help="print one JSON object per list size instead")
+    parser_offline.set_defaults(func=bench_offline)
+    args = parser.parse_args()
+    args.func(args)
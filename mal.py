@@ -1,39 +1,347 @@
-import requests, ast, warnings, json, qbittorrentapi, time, pickle
-from multiprocessing import Process
-from multiprocessing.shared_memory import SharedMemory
-# for some reason the MAL API returns the 'main_picture' field even without asking for it and it
-# contains many instances of '\/' which throw a bunch of warnings on screen, so just supress them
-warnings.filterwarnings(action="ignore", category=SyntaxWarning)
+import json, time, sqlite3, urllib.parse, os, sys, re, heapq, argparse, importlib.util, bisect
+from operator import attrgetter
+from collections import OrderedDict
+from concurrent.futures import CancelledError, Future, ThreadPoolExecutor, as_completed
+from typing import Callable, Iterator
+from threading import Event, Lock, Thread, local
+
+
+def lazy_import(name: str):
+    # the module only actually gets imported the first time one of its attributes is used, so commands that never
+    # touch the network (or qBittorrent) don't pay for importing requests and qbittorrentapi at startup
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+
+requests = lazy_import("requests")
+qbittorrentapi = lazy_import("qbittorrentapi")
+pickle = lazy_import("pickle")
+try:
+    from orjson import loads as json_loads     # optional, much faster than the standard library's json module
+except ImportError:
+    from json import loads as json_loads
 NA = "n/a"
 CANCELLED = "cancelled"
+LIST_FILE = "list.db"
+LEGACY_CACHE_FILE = "cache.bin"
+TOKEN_FILE = "secret_token.json"
+RESPONSE_CACHE_FILE = "response_cache.db"
 
 #################################
 # Class Definitions             #
 #################################
 
 
+class Histogram:
+    counts: 'list[int]'     # number of observations per bucket, counts[i] is everything <= BUCKETS[i] (and > BUCKETS[i - 1])
+    total: float            # sum of all observations
+    count: int
+    max: float
+    # seconds, from parsing a single show (tens of microseconds) up to a request stuck behind retries
+    BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, float("inf"))
+
+    def __init__(self) -> None:
+        self.counts = [0] * len(self.BUCKETS)
+        self.total = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.BUCKETS, value)] += 1
+        self.total += value
+        self.count += 1
+        self.max = max(self.max, value)
+
+    def percentile(self, p: float) -> float:
+        # upper bound of the bucket the p-th percentile falls in, good enough to tell 5ms from 500ms
+        rank = p / 100 * self.count
+        seen = 0
+        for bound, count in zip(self.BUCKETS, self.counts):
+            seen += count
+            if seen >= rank and seen > 0:
+                return min(bound, self.max)
+        return self.max
+
+
+class Metrics:
+    enabled: bool           # every instrumented spot checks this first, so turning metrics off costs next to nothing
+    path: 'str | None'      # where dump() writes to, .json for JSON and anything else for Prometheus text
+    lock: Lock              # metrics get recorded from worker threads
+    counters: 'dict[str, float]'            # keyed by name and labels in Prometheus syntax, eg 'mal_requests_total{status="200"}'
+    histograms: 'dict[str, Histogram]'      # same, latencies in seconds
+    started: float
+
+    def __init__(self, enabled: bool = False, path: 'str | None' = None) -> None:
+        self.enabled = enabled
+        self.path = path
+        self.lock = Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        self.counters = {}
+        self.histograms = {}
+        self.started = time.time()
+
+    def count(self, key: str, value: float = 1) -> None:
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, key: str, seconds: float) -> None:
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(seconds)
+
+    def report(self) -> str:
+        if not self.enabled:
+            return "Metrics are off, start with `python mal.py --metrics` to collect them."
+        with self.lock:
+            lines = [f"Metrics for the last {time.time() - self.started:.0f}s:"]
+            for key, histogram in sorted(self.histograms.items()):
+                lines.append(f"  {key:<48} {histogram.count:>8} | avg {histogram.total / histogram.count * 1000:.2f}ms, "
+                             f"p50 {histogram.percentile(50) * 1000:.2f}ms, p95 {histogram.percentile(95) * 1000:.2f}ms, max {histogram.max * 1000:.2f}ms")
+            for key, value in sorted(self.counters.items()):
+                lines.append(f"  {key:<48} {value:>8.6g}")
+            # anything counted with result="hit"/"miss" labels is a cache
+            for name in sorted({key.partition("{")[0] for key in self.counters if 'result="hit"' in key or 'result="miss"' in key}):
+                hits = self.counters.get(f'{name}{{result="hit"}}', 0)
+                total = hits + self.counters.get(f'{name}{{result="miss"}}', 0)
+                lines.append(f"  {name} hit rate: {hits / total * 100:.1f}%")
+        return "\n".join(lines)
+
+    def to_json(self) -> dict:
+        with self.lock:
+            return {"started": self.started,
+                    "counters": dict(self.counters),
+                    "histograms": {key: {"count": i.count, "sum": i.total, "max": i.max, "p50": i.percentile(50), "p95": i.percentile(95),
+                                         "buckets": {str(bound): count for bound, count in zip(i.BUCKETS, i.counts)}}
+                                   for key, i in self.histograms.items()}}
+
+    def to_prometheus(self) -> str:
+        # text exposition format, eg for node_exporter's textfile collector
+        lines = []
+        with self.lock:
+            for kind, items in (("counter", self.counters), ("histogram", self.histograms)):
+                last = None
+                for key, value in sorted(items.items()):
+                    name, _, labels = key.partition("{")
+                    labels = labels.rstrip("}")
+                    if name != last:
+                        lines.append(f"# TYPE {name} {kind}")
+                        last = name
+                    if kind == "counter":
+                        lines.append(f"{key} {value}")
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(value.BUCKETS, value.counts):
+                        cumulative += count
+                        lines.append(f'{name}_bucket{{{labels + "," if labels else ""}le="{"+Inf" if bound == float("inf") else bound}"}} {cumulative}')
+                    lines.append(f"{name}_sum{'{' + labels + '}' if labels else ''} {value.total}")
+                    lines.append(f"{name}_count{'{' + labels + '}' if labels else ''} {value.count}")
+        return "\n".join(lines) + "\n"
+
+    def dump(self, path: 'str | None' = None) -> None:
+        # written to a temporary file first so whatever is reading it never sees half a dump
+        path = self.path if path is None else path
+        if path is None or not self.enabled:
+            return
+        data = json.dumps(self.to_json(), indent=2) if path.endswith(".json") else self.to_prometheus()
+        with open(path + ".tmp", "w") as f:
+            f.write(data)
+        os.replace(path + ".tmp", path)
+
+
+METRICS = Metrics()     # shared by everything in this file, see get_parser for turning it on
+
+
+class RateLimiter:
+    rate: float         # tokens added per second
+    capacity: float     # max number of tokens that can build up while idle (ie burst size)
+    tokens: float       # tokens currently available, goes negative when callers have reserved future tokens
+    updated: float      # last time the bucket was topped up
+    lock: Lock          # the limiter is shared between worker threads
+
+    def __init__(self, rate: float, capacity: float = 1) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = Lock()
+
+    def acquire(self) -> float:
+        # take a token, sleeping until it's actually available. each caller reserves its token under the lock and
+        # then sleeps outside of it, so concurrent callers queue up one interval apart instead of all waking at once
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+
+class ResponseCache:
+    memory: 'OrderedDict[str, tuple[float, float, dict]]'   # in-memory LRU in front of the database, key -> (expiry time, stored time, response)
+    max_memory: int     # max number of responses kept in memory
+    max_disk: int       # max number of responses kept on disk, the least recently stored ones get evicted first
+    db: sqlite3.Connection
+    lock: Lock          # the cache is shared between the refresher's worker threads
+    hits: int
+    misses: int
+    puts: int           # number of responses stored since the disk cache was last trimmed
+    # how long a response stays fresh depending on the show's airing status, finished shows basically never change
+    TTLS = {"finished_airing": 365 * 24 * 3600, "currently_airing": 6 * 3600, "not_yet_aired": 12 * 3600}
+    DEFAULT_TTL = 6 * 3600
+    TRIM_EVERY = 100
+
+    def __init__(self, path: str, max_memory: int = 1024, max_disk: int = 20000) -> None:
+        self.memory = OrderedDict()
+        self.max_memory = max_memory
+        self.max_disk = max_disk
+        self.lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.puts = 0
+        self.db = sqlite3.connect(path, isolation_level=None, check_same_thread=False)   # autocommit, access is serialized by self.lock
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, expires REAL, stored REAL, data BLOB)")
+        self.db.execute("DELETE FROM responses WHERE expires < ?", (time.time(),))
+        self.trim()
+
+    def get(self, key: str) -> 'tuple[float, dict] | None':
+        # (when the response was stored, response)
+        now = time.time()
+        with self.lock:
+            entry = self.memory.get(key)
+            if entry is None:
+                row = self.db.execute("SELECT expires, stored, data FROM responses WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    entry = (row[0], row[1], json_loads(row[2]))
+                    self.remember(key, entry)
+                if METRICS.enabled:
+                    METRICS.count("response_cache_disk_reads_total")
+            else:
+                self.memory.move_to_end(key)
+            if entry is None or entry[0] < now:
+                self.misses += 1
+                if METRICS.enabled:
+                    METRICS.count('response_cache_requests_total{result="miss"}')
+                return None
+            self.hits += 1
+            if METRICS.enabled:
+                METRICS.count('response_cache_requests_total{result="hit"}')
+            return entry[1], entry[2]
+
+    def put(self, key: str, json_data: dict) -> None:
+        now = time.time()
+        entry = (now + self.TTLS.get(json_data.get("status"), self.DEFAULT_TTL), now, json_data)
+        data = json.dumps(json_data, separators=(",", ":"))
+        with self.lock:
+            self.remember(key, entry)
+            self.db.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)", (key, entry[0], now, data))
+            self.puts += 1
+            if self.puts >= self.TRIM_EVERY:
+                self.trim()
+
+    def remember(self, key: str, entry: 'tuple[float, float, dict]') -> None:
+        self.memory[key] = entry
+        self.memory.move_to_end(key)
+        if len(self.memory) > self.max_memory:
+            self.memory.popitem(last=False)
+
+    def trim(self) -> None:
+        self.db.execute("DELETE FROM responses WHERE key NOT IN (SELECT key FROM responses ORDER BY stored DESC LIMIT ?)", (self.max_disk,))
+        self.puts = 0
+
+    def forget(self, key: str) -> None:
+        with self.lock:
+            self.memory.pop(key, None)
+            self.db.execute("DELETE FROM responses WHERE key = ?", (key,))
+
+    def report(self) -> str:
+        total = self.hits + self.misses
+        return f"Response cache: {self.hits} hits, {self.misses} misses ({self.hits / total * 100 if total > 0 else 0:.1f}% hit rate), {len(self.memory)} in memory."
+
+
 class MAL:
     ACCESS_TOKEN: str
     REFRESH_TOKEN: str
-    last_request: float
-    timeout: float = 0.5
+    session: 'requests.Session | None'  # keeps connections to the api alive between requests, created on first use
+    session_lock: Lock
+    pool_size: int              # max number of pooled connections, ie how many requests can be in flight at once
+    limiter: RateLimiter        # shared by every thread sending requests through this client
+    local: local                # per-thread info about the last request (eg how long it waited on the limiter, when its data was fetched)
+    cache: 'ResponseCache | None'   # consulted by get_info before going to the network
+    identity_map: 'dict[int, Future[Show]]' # every show loaded through get_show this session, so each id is only fetched once
+    identity_lock: Lock
+    timeout: float = 0.5        # minimum average interval between requests
+    burst: int = 4              # number of requests that can go out back to back after being idle
+    retries: int = 3            # how many times to retry a request that got rate limited or hit a server error
+    backoff: float = 1          # seconds to wait before the first retry, doubles on every retry after that
+    RETRY_STATUSES = (429, 500, 502, 503, 504)
+    API_URL = "https://api.myanimelist.net/v2"
+    FIELDS = "id,title,alternative_titles,status,num_episodes,mean,related_anime,start_season,genres,updated_at"
+    SEARCH_FIELDS = "id,title,alternative_titles,status,num_episodes,mean,start_season,genres,updated_at"    # list endpoints can't return related_anime
 
-    def __init__(self, token_file: str) -> None:
-        self.last_request = time.time()
+    def __init__(self, token_file: str, pool_size: int = 8, cache: 'ResponseCache | None' = None) -> None:
+        self.pool_size = pool_size
+        self.cache = cache
+        self.identity_map = {}
+        self.identity_lock = Lock()
+        self.limiter = RateLimiter(1 / self.timeout, self.burst)
+        self.local = local()
         # https://myanimelist.net/apiconfig/references/api/v2 <-- api docs
         # load MAL API tokens -> see refresh_token.py for getting tokens
         with open(token_file) as f:
             data = json.load(f)
             self.ACCESS_TOKEN = data["access_token"]
             self.REFRESH_TOKEN = data["refresh_token"]
+        self.session = None
+        self.session_lock = Lock()
+
+    def get_session(self) -> 'requests.Session':
+        with self.session_lock:
+            if self.session is None:
+                self.session = requests.Session()
+                self.session.headers["Authorization"] = f"Bearer {self.ACCESS_TOKEN}"
+                adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+                self.session.mount("https://", adapter)
+                self.session.mount("http://", adapter)
+            return self.session
 
     def send_request(self, url: str) -> dict:
-        diff = (time.time() - self.last_request)
-        if diff < self.timeout:
-            time.sleep(diff)
-        response = requests.get(url, headers={"Authorization": f"Bearer {self.ACCESS_TOKEN}"})
-        self.last_request = time.time()
-        return ast.literal_eval(response.text)  # converts the json response.text field (essentially a string of response.content) into a python dict
+        self.local.waited = 0.0
+        for attempt in range(self.retries + 1):
+            throttled = self.limiter.acquire()
+            self.local.waited += throttled
+            start = time.perf_counter()
+            response = self.get_session().get(url)
+            if METRICS.enabled:
+                METRICS.observe("mal_request_seconds", time.perf_counter() - start)
+                METRICS.count(f'mal_requests_total{{status="{response.status_code}"}}')
+                METRICS.count("mal_throttle_seconds_total", throttled)
+                METRICS.count("mal_response_bytes_total", len(response.content))
+            if response.status_code not in self.RETRY_STATUSES or attempt == self.retries:
+                break
+            # back off exponentially, unless the api tells us exactly how long to wait
+            retry_after = response.headers.get("Retry-After", "")
+            delay = float(retry_after) if retry_after.isdigit() else self.backoff * 2 ** attempt
+            time.sleep(delay)
+            self.local.waited += delay
+            if METRICS.enabled:
+                METRICS.count("mal_retry_seconds_total", delay)
+        return json_loads(response.content)    # decode straight from the raw bytes, no need to build response.text first
 
     def get_name(self, json_dict: dict) -> str:
         name = json_dict["alternative_titles"]["en"]
@@ -41,27 +349,99 @@ class MAL:
             name = json_dict["title"]
         return name
 
-    def get_info(self, anime_id: int) -> dict:
-        url = f"https://api.myanimelist.net/v2/anime/{anime_id}?fields=id,title,alternative_titles,status,num_episodes,mean,related_anime,start_season,genres"
-        json_dict = self.send_request(url)
+    def get_info(self, anime_id: int, fields: str = FIELDS, cached: bool = True) -> dict:
+        # cached=False skips the cache lookup (eg for an explicit refresh), the fresh response still gets stored
+        key = f"{anime_id}?fields={fields}"
+        if self.cache is not None and cached:
+            entry = self.cache.get(key)
+            if entry is not None:
+                self.local.waited = 0.0
+                self.local.fetched_at = entry[0]    # a cached response is as old as when it was first fetched
+                return entry[1]
+        json_dict = self.send_request(f"{self.API_URL}/anime/{key}")
+        self.local.fetched_at = time.time()
+        if self.cache is not None and "error" not in json_dict:
+            self.cache.put(key, json_dict)
         return json_dict
 
+    def forget(self, anime_id: int, fields: str = FIELDS) -> None:
+        # drop a cached get_info response, eg because we know the show changed since
+        if self.cache is not None:
+            self.cache.forget(f"{anime_id}?fields={fields}")
+
+    def get_user_list(self) -> 'dict[int, dict]':
+        # every show on the user's MAL list, id -> node with SEARCH_FIELDS. up to 1000 shows per request
+        out = {}
+        url = f"{self.API_URL}/users/@me/animelist?{urllib.parse.urlencode({'fields': self.SEARCH_FIELDS, 'limit': 1000, 'nsfw': 'true'})}"
+        while url is not None:
+            json_dict = self.send_request(url)
+            for i in json_dict["data"]:
+                out[i["node"]["id"]] = i["node"]
+            url = json_dict.get("paging", {}).get("next")
+        return out
+
     def get_val(self, json_data: dict, key: str) -> str:
         try:
             return json_data[key]
         except KeyError:
             return NA
 
-    def search_mal(self, search: str) -> 'list[Show]':
+    def get_show(self, anime_id: int) -> 'Show':
+        # the first caller for an id fetches it, anyone asking for the same id meanwhile waits on the same future
+        with self.identity_lock:
+            future = self.identity_map.get(anime_id)
+            fetch = future is None
+            if fetch:
+                future = self.identity_map[anime_id] = Future()
+        if METRICS.enabled:
+            METRICS.count(f'show_identity_map_requests_total{{result="{"miss" if fetch else "hit"}"}}')
+        if fetch:
+            try:
+                future.set_result(Show(anime_id, self))
+            except Exception as e:
+                with self.identity_lock:
+                    del self.identity_map[anime_id]     # don't remember failures, the next caller can try again
+                future.set_exception(e)
+        return future.result()
+
+    def resolve_related(self, related: 'list[RelatedShow]') -> 'list[RelatedShow]':
+        # resolve all the unresolved handles concurrently, in one batch
+        unresolved = [i for i in related if i.show is None]
+        with ThreadPoolExecutor(self.pool_size) as pool:
+            for handle, show in zip(unresolved, pool.map(self.get_show, [i.id for i in unresolved])):
+                handle.show = show
+        return related
+
+    def get_franchise(self, show: 'Show', depth: int = 2) -> 'list[RelatedShow]':
+        # breadth first walk of the related anime graph up to depth hops away from show, each level is resolved as one batch
+        seen = {show.id}
         out = []
-        url = f"https://api.myanimelist.net/v2/anime?q={search}&fields=alternative_titles,anime_id"
-        json_dict = self.send_request(url)
-        index = 0
-        for i in json_dict["data"]:
-            show = Show(i["node"]["id"], self)
-            print(f"  [{index}] : {show}")
-            out.append(show)
-            index += 1
+        level = show.get_related(self)
+        for _ in range(depth):
+            kept = []
+            for i in level:
+                if i.id not in seen:   # the same show can be related to several shows on one level
+                    seen.add(i.id)
+                    kept.append(i)
+            level = kept
+            out += self.resolve_related(level)
+            level = [j for i in level for j in i.show.related_shows]
+        return out
+
+    def search_mal(self, search: str, limit: int = 10, pages: int = 1, print_results: bool = True) -> 'list[Show]':
+        # the search results already contain everything a Show needs, so this is one request per page of results
+        out = []
+        url = f"{self.API_URL}/anime?{urllib.parse.urlencode({'q': search, 'limit': limit, 'fields': self.SEARCH_FIELDS})}"
+        for _ in range(pages):
+            json_dict = self.send_request(url)
+            for i in json_dict["data"]:
+                show = Show.from_json(i["node"], self)
+                if print_results:
+                    print(f"  [{len(out)}] : {show}")
+                out.append(show)
+            url = json_dict.get("paging", {}).get("next")
+            if url is None:
+                break
         return out
 
 
@@ -71,29 +451,64 @@ class Show:
     is_completed: bool                  # is this show finished airing
     length: int                         # number of episodes
     rating: float                       # MAL score of this show
-    related_shows: 'list[RelatedShow]'  # dict object of 'related_anime' field of json
+    related_shows: 'list[RelatedShow]'  # lazy handles built from the 'related_anime' field of json, see get_related
     start_season: str			# 'spring 2014', 'summer 2023', etc
-    genres: []
+    genres: 'tuple[str, ...]'           # interned, there's only a few dozen distinct genres across all shows
+    alt_titles: 'tuple[str, ...]'       # romaji/english/japanese titles and synonyms, used for searching
+    updated_at: str                     # when MAL last changed this show's entry, used to tell whether it needs refreshing
+    fetched_at: float                   # when we got this show's data, used to refresh the stalest shows first
+    __slots__ = ("name", "id", "is_completed", "length", "rating", "related_shows", "start_season", "genres", "alt_titles", "updated_at", "fetched_at")
+
+    def __init__(self, id: int, mal: MAL, load_related: bool = False, cached: bool = True) -> None:
+        self.load(mal.get_info(id, cached=cached), mal, load_related)
+        self.fetched_at = mal.local.fetched_at
 
-    def __init__(self, id: int, mal: MAL, load_related: bool = False) -> None:
-        self.id = id
-        json_data = mal.get_info(id)
+    @classmethod
+    def from_json(cls, json_data: dict, mal: MAL, load_related: bool = False) -> 'Show':
+        # build a show from data we already have (eg a search result node) instead of fetching it again
+        show = cls.__new__(cls)
+        show.load(json_data, mal, load_related)
+        return show
+
+    def load(self, json_data: dict, mal: MAL, load_related: bool = False) -> None:
+        start = time.perf_counter() if METRICS.enabled else 0.0
+        self.id = json_data["id"]
         self.name = mal.get_name(json_data)
+        titles = json_data.get("alternative_titles", {})
+        self.alt_titles = tuple(i for i in [json_data["title"], titles.get("en", ""), titles.get("ja", ""), *titles.get("synonyms", [])] if i != "")
         self.is_completed = json_data["status"] == "finished_airing"
+        self.updated_at = json_data.get("updated_at", "")
+        self.fetched_at = time.time()
         self.length = mal.get_val(json_data, "num_episodes")
         mean = mal.get_val(json_data, "mean")
         self.rating = -1 if mean == NA else float(mean)
-        self.related_shows = [RelatedShow(i, mal) for i in json_data["related_anime"]] if load_related else []
+        self.related_shows = [RelatedShow(i) for i in json_data.get("related_anime", [])]
         try:
-            self.start_season = json_data["start_season"]["season"] + " " + str(json_data["start_season"]["year"])
+            self.start_season = sys.intern(json_data["start_season"]["season"] + " " + str(json_data["start_season"]["year"]))
         except KeyError:
             self.start_season = "unknown release season"
-        self.genres = []
         try:
-            for genre in json_data["genres"]:	# will be an array of form [{id: some_num, name: "string describing genre"}, {id: some_other_num, name: "string describing genre"}]
-                self.genres.append(genre["name"])
+            # will be an array of form [{id: some_num, name: "string describing genre"}, {id: some_other_num, name: "string describing genre"}]
+            self.genres = tuple(sys.intern(genre["name"]) for genre in json_data["genres"])
         except KeyError: # no genres yet
-            self.genres = ["No genres yet"]
+            self.genres = ("No genres yet",)
+        if METRICS.enabled:
+            METRICS.observe("show_load_seconds", time.perf_counter() - start)     # parsing only, not the request
+        if load_related:
+            mal.resolve_related(self.related_shows)
+
+    def __setstate__(self, state: 'dict | tuple[None, dict]') -> None:
+        # shows pickled before Show had __slots__ have a plain dict for their state, newer ones have (None, slots).
+        # unpickling doesn't intern strings, so do it again here or every stored show gets its own copies
+        if isinstance(state, tuple):
+            state = state[1]
+        self.alt_titles = ()    # older shows don't have every field
+        self.updated_at = ""
+        self.fetched_at = 0.0
+        for key, value in state.items():
+            setattr(self, key, value)
+        self.start_season = sys.intern(self.start_season)
+        self.genres = tuple(sys.intern(genre) for genre in self.genres)
 
     def __str__(self) -> str:
         # https://gist.github.com/egmontkob/eb114294efbcd5adb1944c9f3cb5feda
@@ -108,19 +523,185 @@ class Show:
     def __lt__(self, i: 'Show') -> bool:
         return i.rating < self.rating
 
+    def outdated(self, node: dict) -> bool:
+        # whether a node from a list endpoint (ie with MAL.SEARCH_FIELDS) has different data than this show. the score
+        # and episode count can change without MAL touching updated_at, so those get compared too
+        mean = node.get("mean", NA)
+        return (node.get("updated_at", "") != self.updated_at
+                or (node["status"] == "finished_airing") != self.is_completed
+                or node.get("num_episodes", NA) != self.length
+                or (-1 if mean == NA else float(mean)) != self.rating)
+
+    @staticmethod
+    def sort(shows: 'list[Show]') -> 'list[Show]':
+        # same order as sorted(shows), but with a key instead of calling __lt__ for every comparison
+        return sorted(shows, key=attrgetter("rating"), reverse=True)
+
+    def to_json(self) -> dict:
+        return {"id": self.id, "name": self.name, "url": f"https://myanimelist.net/anime/{self.id}", "is_completed": self.is_completed,
+                "episodes": None if self.length == NA else self.length, "rating": None if self.rating == -1 else self.rating,
+                "start_season": self.start_season, "genres": list(self.genres), "alt_titles": list(self.alt_titles), "updated_at": self.updated_at}
+
+    def get_related(self, mal: MAL) -> 'list[RelatedShow]':
+        # shows built from search results (or cached by older versions) don't know their related anime yet
+        if len(self.related_shows) == 0:
+            self.related_shows = [RelatedShow(i) for i in mal.get_info(self.id).get("related_anime", [])]
+        return mal.resolve_related(self.related_shows)
+
     def related_shows_to_str(self) -> str:
         return "\n  " + '\n  '.join([str(i) for i in self.related_shows])
 
 
-class RelatedShow(Show):
-    relation_type: str
+class RelatedShow:
+    id: int                 # MAL id of the related show
+    relation_type: str      # 'Prequel', 'Side story', etc
+    show: 'Show | None'     # the related show itself, None until it's been resolved with MAL.resolve_related
+    __slots__ = ("id", "relation_type", "show")
 
-    def __init__(self, json: dict, mal: MAL) -> None:
-        super().__init__(json["node"]["id"], mal, False)
+    def __init__(self, json: dict) -> None:
+        self.id = json["node"]["id"]
         self.relation_type = json["relation_type_formatted"]
+        self.show = None
+
+    def __getattr__(self, name: str):
+        # only called for attributes the handle doesn't have itself, forward those to the resolved show
+        if name == "show" or name.startswith("__"):
+            raise AttributeError(name)
+        if self.show is None:
+            raise AttributeError(f"related show {self.id} hasn't been resolved yet, can't get '{name}'")
+        return getattr(self.show, name)
+
+    def __getstate__(self) -> dict:
+        return {"id": self.id, "relation_type": self.relation_type}   # don't cache resolved shows, they go stale
+
+    def __setstate__(self, state: dict) -> None:
+        self.id = state["id"]
+        self.relation_type = state["relation_type"]
+        self.show = None
 
     def __str__(self) -> str:
-        return f"{super().__str__()} | {self.relation_type}"
+        return f"{self.show} | {self.relation_type}"
+
+
+class SearchIndex:
+    names: 'dict[int, str]'                 # show id -> lowercased name and alternative titles
+    trigrams: 'dict[str, set[int]]'         # trigram -> ids of shows whose names contain it
+    values: 'dict[str, dict[str, set[int]]]' # 'genre'/'season' -> lowercased value -> ids of shows with that value
+    shows: 'dict[int, Show]'
+    order: 'dict[int, int]'                 # show id -> when it was added, results come back in that order
+    added: int
+    FIELDS = ("name", "genre", "season")
+    FUZZY_THRESHOLD = 0.5   # min share of the query's trigrams a name needs to have to count as a fuzzy match
+    FUZZY_RESULTS = 10
+    FUZZY_BUDGET = 2000     # max ids counted for a fuzzy match, keeps typo lookups under a millisecond on big lists
+
+    def __init__(self, shows: 'list[Show]') -> None:
+        # building it is the slow part of loading the list, about 30ms per 1000 shows (~3s for 100k)
+        self.names = {}
+        self.trigrams = {}
+        self.values = {"genre": {}, "season": {}}
+        self.shows = {}
+        self.order = {}
+        self.added = 0
+        for show in shows:
+            self.add(show)
+
+    @staticmethod
+    def get_trigrams(text: str) -> 'set[str]':
+        return {text[i:i + 3] for i in range(len(text) - 2)}
+
+    @staticmethod
+    def get_values(show: Show) -> 'dict[str, list[str]]':
+        return {"genre": [genre.lower() for genre in show.genres], "season": [show.start_season.lower()]}
+
+    def add(self, show: Show) -> None:
+        # also used to update a show that was refreshed, it replaces whatever was indexed for that id
+        if show.id in self.shows:
+            position = self.order[show.id]  # keep its place in the results
+            self.remove(self.shows[show.id])
+            self.order[show.id] = position
+        else:
+            self.order[show.id] = self.added
+            self.added += 1
+        name = " | ".join((show.name,) + show.alt_titles).lower()
+        for trigram in self.get_trigrams(name):
+            self.trigrams.setdefault(trigram, set()).add(show.id)
+        for field, values in self.get_values(show).items():
+            for value in values:
+                self.values[field].setdefault(value, set()).add(show.id)
+        self.names[show.id] = name
+        self.shows[show.id] = show
+
+    def remove(self, show: Show) -> None:
+        name = self.names.pop(show.id, None)
+        if name is None:
+            return
+        show = self.shows.pop(show.id)  # the indexed version of the show, the one passed in might have been refreshed since
+        del self.order[show.id]
+        for trigram in self.get_trigrams(name):
+            self.discard(self.trigrams, trigram, show.id)
+        for field, values in self.get_values(show).items():
+            for value in values:
+                self.discard(self.values[field], value, show.id)
+
+    @staticmethod
+    def discard(index: 'dict[str, set[int]]', key: str, id: int) -> None:
+        ids = index[key]
+        ids.discard(id)
+        if len(ids) == 0:
+            del index[key]
+
+    def match(self, field: str, value: str) -> 'set[int]':
+        # ids of shows with value somewhere in field
+        if field != "name":
+            # only a few dozen genres and a few hundred seasons, so checking every distinct value is cheap
+            return set().union(*[ids for i, ids in self.values[field].items() if value in i])
+        if len(value) < 3:
+            return {id for id, name in self.names.items() if value in name}
+        # the trigram index narrows it down to a few candidates, which then get checked for the actual substring
+        candidates = None
+        for ids in sorted([self.trigrams.get(i, set()) for i in self.get_trigrams(value)], key=len):
+            candidates = set(ids) if candidates is None else candidates & ids
+            if len(candidates) == 0:
+                return candidates
+        return {id for id in candidates if value in self.names[id]}
+
+    def fuzzy(self, value: str) -> 'list[int]':
+        # names sharing the most trigrams with value, for when there's no exact match (eg a typo). only the rarest
+        # trigrams are counted, up to FUZZY_BUDGET ids: trigrams lots of names have (eg 'the') say little about which
+        # show was meant and are slow to count. on a big list a typo made only of common trigrams finds nothing
+        postings = sorted([ids for ids in (self.trigrams.get(i) for i in self.get_trigrams(value)) if ids is not None], key=len)
+        rare = []
+        budget = self.FUZZY_BUDGET
+        for ids in postings:
+            budget -= len(ids)
+            if budget < 0:
+                break
+            rare.append(ids)
+        if len(rare) == 0:
+            return []
+        counts = {}
+        for ids in rare:
+            for id in ids:
+                counts[id] = counts.get(id, 0) + 1
+        matches = [id for id, count in counts.items() if count / len(rare) >= self.FUZZY_THRESHOLD]
+        return sorted(matches, key=lambda id: (-counts[id], self.order[id]))[:self.FUZZY_RESULTS]
+
+    def search(self, query: str) -> 'list[Show]':
+        # free text matches any field, `field:value` only matches that field, eg `slime genre:action season:spring 2024`
+        query = query.lower().strip()
+        parts = re.split(r"\b(" + "|".join(self.FIELDS) + r"):", query)
+        clauses = [("", parts[0].strip())] + [(parts[i], parts[i + 1].strip()) for i in range(1, len(parts), 2)]
+        clauses = [(field, value) for field, value in clauses if value != ""]
+        if len(clauses) == 0:
+            return sorted(self.shows.values(), key=lambda show: self.order[show.id])
+        ids = None
+        for field, value in clauses:
+            matched = self.match(field, value) if field != "" else set().union(*[self.match(i, value) for i in self.FIELDS])
+            ids = matched if ids is None else ids & matched
+        if len(ids) == 0 and len(clauses) == 1 and clauses[0][0] in ("", "name") and len(clauses[0][1]) >= 3:
+            return [self.shows[id] for id in self.fuzzy(clauses[0][1])]
+        return [self.shows[id] for id in sorted(ids, key=self.order.__getitem__)]
 
 
 class Torrent:
@@ -129,6 +710,7 @@ class Torrent:
     seeders: int            # number of seeders
     size: int               # size of the torrent in bytes
     name: str               # name of the torrent
+    __slots__ = ("description_url", "file_url", "seeders", "size", "name")
 
     def __init__(self, qb_dict) -> None:
         self.description_url = qb_dict["descrLink"]
@@ -156,59 +738,453 @@ class Torrent:
         return i.seeders < self.seeders
 
 
+class TorrentSearch:
+    client: 'qbittorrentapi.Client'
+    query: str
+    plugins: str            # search plugins to use, eg 'nyaasi' or 'all'
+    category: str           # eg 'anime' or 'all'
+    timeout: float          # seconds before the search gets stopped even if qBittorrent is still running it
+    min_interval: float     # seconds between polls while new results keep coming in
+    max_interval: float     # polling backs off up to this while nothing new shows up
+    cancelled: Event        # set by cancel(), also wakes up a poll that's waiting
+    job: 'qbittorrentapi.search.SearchJobDictionary | None'
+    received: int           # number of results received so far
+
+    def __init__(self, client: 'qbittorrentapi.Client', query: str, plugins: str = "all", category: str = "all",
+                 timeout: float = 60, min_interval: float = 0.1, max_interval: float = 2) -> None:
+        self.client = client
+        self.query = query
+        self.plugins = plugins
+        self.category = category
+        self.timeout = timeout
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.cancelled = Event()
+        self.job = None
+        self.received = 0
+
+    def results(self) -> 'Iterator[list[Torrent]]':
+        # starts the search and yields batches of new results as qBittorrent finds them. the results endpoint also
+        # reports the job's status, so each poll is a single request. ctrl+c while this is waiting on qBittorrent
+        # counts as cancel(), the search gets stopped and still returns what it found
+        started = time.perf_counter()
+        self.job = self.client.search_start(self.query, self.plugins, self.category)
+        deadline = time.monotonic() + self.timeout
+        interval = self.min_interval
+        stopped = False
+        try:
+            while True:
+                start = time.perf_counter()
+                try:
+                    response = self.job.results(offset=self.received)
+                except KeyboardInterrupt:
+                    if stopped:
+                        raise   # ctrl+c during the last poll gives up on it
+                    self.cancel()
+                    self.job.stop()
+                    stopped = True
+                    continue
+                if METRICS.enabled:
+                    METRICS.observe("qbittorrent_poll_seconds", time.perf_counter() - start)
+                    METRICS.count("qbittorrent_results_total", len(response["results"]))
+                batch = [Torrent(i) for i in response["results"]]
+                if len(batch) > 0:
+                    self.received += len(batch)
+                    interval = self.min_interval
+                    yield batch
+                else:
+                    interval = min(interval * 2, self.max_interval)
+                if response["status"] != "Running" or stopped:
+                    break
+                start = time.perf_counter()
+                remaining = deadline - time.monotonic()
+                try:
+                    cancelled = remaining <= 0 or self.cancelled.wait(min(interval, remaining))
+                except KeyboardInterrupt:
+                    self.cancel()
+                    cancelled = True
+                if cancelled:
+                    # poll one last time after stopping, for whatever was found since the last poll
+                    self.job.stop()
+                    stopped = True
+                    continue
+                if METRICS.enabled:
+                    METRICS.count("qbittorrent_poll_wait_seconds_total", time.perf_counter() - start)
+        finally:
+            self.job.delete()   # qBittorrent keeps finished jobs (and their results) around until they're deleted
+            if METRICS.enabled:
+                METRICS.observe("qbittorrent_search_seconds", time.perf_counter() - started)
+
+    def cancel(self) -> None:
+        self.cancelled.set()
+
+
+class TorrentRanker:
+    k: int                                      # how many of the best torrents to keep
+    scorers: 'list[Callable[[Torrent], float]]' # higher is better, later scorers only break ties of earlier ones
+    heap: 'list[tuple[tuple, int, str, Torrent]]'   # min heap of the best k so far (score, order, dedupe key, torrent), worst on top
+    copies: 'dict[str, tuple[tuple, int]]'      # dedupe key -> score and order of the best copy added so far
+    added: int
+
+    def __init__(self, k: int = 10, scorers: 'list[Callable[[Torrent], float]] | None' = None) -> None:
+        self.k = k
+        self.scorers = [TorrentRanker.seeders] if scorers is None else scorers
+        self.heap = []
+        self.copies = {}
+        self.added = 0
+
+    @staticmethod
+    def seeders(torrent: Torrent) -> float:
+        return torrent.seeders
+
+    @staticmethod
+    def size(torrent: Torrent) -> float:
+        return torrent.size
+
+    @staticmethod
+    def size_window(low: int, high: int) -> 'Callable[[Torrent], float]':
+        # prefer torrents between low and high bytes, eg to skip single episodes when looking for a batch
+        return lambda torrent: 1 if low <= torrent.size <= high else 0
+
+    @staticmethod
+    def release_groups(groups: 'list[str]') -> 'Callable[[Torrent], float]':
+        # prefer releases from the given groups, earlier groups are preferred over later ones
+        tags = [f"[{group.lower()}]" for group in groups]
+        def score(torrent: Torrent) -> float:
+            name = torrent.name.lower()
+            for i in range(len(tags)):
+                if tags[i] in name:
+                    return len(tags) - i
+            return 0
+        return score
+
+    @staticmethod
+    def key(torrent: Torrent) -> str:
+        # the same torrent found through different sites has the same info hash, or at least the same name and size
+        match = re.search(r"btih:([0-9a-z]+)", torrent.file_url, re.IGNORECASE)
+        if match is not None:
+            return match.group(1).lower()
+        name = re.sub(r"\.torrent$", "", torrent.name.lower())
+        return f"{' '.join(re.findall(r'[0-9a-z]+', name))}|{torrent.size}"
+
+    def add(self, torrents: 'list[Torrent]') -> None:
+        # only the best k are kept, so this can be fed every batch of a search as it arrives
+        for torrent in torrents:
+            key = self.key(torrent)
+            entry = (tuple(score(torrent) for score in self.scorers), -self.added, key, torrent)  # ties go to whichever came first
+            self.added += 1
+            previous = self.copies.get(key)
+            if previous is not None and previous >= entry[:2]:
+                continue    # already have an at least as good copy of this torrent, eg from another site
+            self.copies[key] = entry[:2]
+            if previous is not None:
+                # a better copy of a duplicate replaces the old one if that's still in the top k
+                position = next((i for i in range(len(self.heap)) if self.heap[i][2] == key), None)
+                if position is not None:
+                    self.heap[position] = entry
+                    heapq.heapify(self.heap)
+                    continue
+            if len(self.heap) < self.k:
+                heapq.heappush(self.heap, entry)
+            elif entry[:2] > self.heap[0][:2]:
+                heapq.heapreplace(self.heap, entry)
+
+    def top(self) -> 'list[Torrent]':
+        return [entry[3] for entry in sorted(self.heap, key=lambda entry: entry[:2], reverse=True)]
+
+    def best(self) -> 'Torrent | None':
+        return max(self.heap, key=lambda entry: entry[:2])[3] if len(self.heap) > 0 else None
+
+
 class LoadingBar:
     prefix: str     # text to put before the loading bar
     cycle: 'list[str]' = ["⠋", "⠙", "⠚", "⠞", "⠖", "⠦", "⠴", "⠲", "⠳", "⠓"]
     total: int      # keep track of total tasks we're loading for
     completed: int  # keep track of total number of completed tasks
-    memory: SharedMemory    # share number of completed tasks with the loading process
+    started: float  # when start() was called, for the rate and eta
+    # every bar that's running is drawn by one shared thread, so bars can be nested or run side by side
+    active: 'list[LoadingBar]' = []
+    lock: Lock = Lock()             # guards active and the terminal line the bars are drawn on
+    wake: Event = Event()           # tells the drawing thread to redraw right away (or exit) instead of waiting
+    drawing: bool = False           # whether the drawing thread is running
+    width: int = 0                  # length of the last line drawn, so it can be cleared
+    tty: bool = sys.stdout.isatty() # when not writing to a terminal, log a line every few seconds instead of animating
+    interval: float = 0.1           # seconds between redraws on a terminal
+    log_interval: float = 5         # seconds between progress lines when not on a terminal
 
     def __init__(self, prefix: str, total_tasks: int = -1) -> None:
         self.prefix = prefix
         self.total = total_tasks
         self.completed = 0
-        self.memory = SharedMemory("loading", True, 5)  # create shared memory for one 4-byte integer and a 1-byte flag
-
-    def loading(self) -> None:
-        length = len(self.cycle)
-        index = 0
-        done = False
-        while not done:
-            done = int.from_bytes(self.memory.buf[4:], "big") == 1
-            percent = ""
-            if self.total != -1:
-                percent = f" {int.from_bytes(self.memory.buf[:4], 'big') / self.total * 100:.2f}%"
-            print(f"\r {self.prefix}{self.cycle[index % length]}{percent}", end="\r", flush=True)
-            index += 1
-            time.sleep(0.1)
-        self.memory.close()
+        self.started = time.monotonic()
+
+    def status(self, frame: int) -> str:
+        elapsed = time.monotonic() - self.started
+        rate = self.completed / elapsed if elapsed > 0 else 0
+        spinner = self.cycle[frame % len(self.cycle)] if LoadingBar.tty else ""
+        if self.total == -1:
+            return f"{self.prefix}{spinner}"
+        eta = f", eta {(self.total - self.completed) / rate:.0f}s" if rate > 0 else ""
+        return f"{self.prefix}{spinner} {self.completed / self.total * 100 if self.total > 0 else 100:.2f}% ({self.completed}/{self.total}, {rate:.1f}/s{eta})"
+
+    @classmethod
+    def draw(cls) -> None:
+        frame = 0
+        while True:
+            with cls.lock:
+                if len(cls.active) == 0:
+                    cls.drawing = False
+                    return
+                line = " | ".join(bar.status(frame) for bar in cls.active)
+                if cls.tty:
+                    print(f"\r {line}{' ' * (cls.width - len(line) - 1)}", end="\r", flush=True)
+                    cls.width = len(line) + 1
+                else:
+                    print(f" {line}", flush=True)
+            frame += 1
+            cls.wake.wait(cls.interval if cls.tty else cls.log_interval)
+            cls.wake.clear()
 
     def start(self) -> None:
-        Process(target=self.loading).start()
+        self.started = time.monotonic()
+        with LoadingBar.lock:
+            LoadingBar.active.append(self)
+            if not LoadingBar.drawing:
+                LoadingBar.drawing = True
+                LoadingBar.wake.clear()     # the last bar's stop() may have woken a thread that had already exited
+                Thread(target=LoadingBar.draw, daemon=True).start()
 
     def stop(self) -> None:
-        self.memory.buf[4:] = int.to_bytes(1, 1, "big")    # set the 'done' flag
-        time.sleep(0.2)    # sleep for 200ms to make sure the loading process exits properly before we unlink the shared memory
-        self.memory.unlink()
-        print(f"\r{' ' * (len(self.prefix) + len(self.cycle[0]) + 9)}", end="\r", flush=True)   # +8 for the ' 100.00%' and +1 for the space before the prefix
-        print(f"{self.prefix}done.")
+        elapsed = time.monotonic() - self.started
+        with LoadingBar.lock:
+            LoadingBar.active.remove(self)
+            if LoadingBar.tty:
+                print(f"\r{' ' * LoadingBar.width}", end="\r", flush=True)
+                LoadingBar.width = 0
+            rate = f" ({self.completed} in {elapsed:.2f}s, {self.completed / elapsed:.1f}/s)" if self.total != -1 and elapsed > 0 else ""
+            print(f"{self.prefix}done.{rate}", flush=True)
+            LoadingBar.wake.set()  # redraw whatever bars are left (or let the drawing thread exit) without waiting
 
     def update(self) -> None:
-        self.completed += 1
-        self.memory.buf[:4] = self.completed.to_bytes(4, "big")
+        with LoadingBar.lock:
+            self.completed += 1
+
+
+class Refresher:
+    mal: MAL
+    workers: int                # max number of requests in flight at once, the MAL rate limiter still applies
+    latencies: 'list[float]'    # seconds spent on each request, not counting time spent waiting on the rate limiter
+    failed: 'list[int]'         # ids we couldn't refresh, their old data is kept
+    elapsed: float              # wall time of the last refresh
+    cached: bool                # whether shows can be refreshed from the response cache if their data is still fresh
+    stopped: Event              # set by stop(), shows that haven't been fetched yet are skipped
+
+    def __init__(self, mal: MAL, workers: int = -1, cached: bool = True) -> None:
+        self.mal = mal
+        self.cached = cached
+        self.stopped = Event()
+        self.workers = mal.pool_size if workers == -1 else workers  # default to one worker per pooled connection
+        self.latencies = []
+        self.failed = []
+        self.elapsed = 0
+
+    def fetch(self, id: int) -> Show:
+        if self.stopped.is_set():
+            raise CancelledError()
+        start = time.perf_counter()
+        show = Show(id, self.mal, cached=self.cached)
+        self.latencies.append(time.perf_counter() - start - getattr(self.mal.local, "waited", 0.0))
+        return show
+
+    def refresh(self, shows: 'list[Show]', bar: 'LoadingBar | None' = None, done: 'Callable[[Show], None] | None' = None) -> 'list[Show]':
+        # refetch all the given shows concurrently, returns them in the same order they were given with the old data
+        # kept for any that failed. done gets called with each refreshed show as soon as it's ready
+        refreshed = self.get([show.id for show in shows], bar, done)
+        return [refreshed.get(show.id, show) for show in shows]
+
+    def get(self, ids: 'list[int]', bar: 'LoadingBar | None' = None, done: 'Callable[[Show], None] | None' = None) -> 'dict[int, Show]':
+        # fetch all the given ids concurrently, ids that failed are left out
+        self.latencies = []
+        self.failed = []
+        out = {}
+        start = time.perf_counter()
+        with ThreadPoolExecutor(self.workers) as pool:
+            futures = {pool.submit(self.fetch, id): id for id in ids}
+            try:
+                for future in as_completed(futures):
+                    id = futures[future]
+                    try:
+                        out[id] = future.result()
+                        if done is not None:
+                            done(out[id])
+                    except CancelledError:
+                        pass
+                    except (requests.exceptions.RequestException, KeyError, ValueError):
+                        self.failed.append(id)
+                    if bar is not None:
+                        bar.update()
+            except KeyboardInterrupt:
+                self.stop()     # otherwise leaving the with block would wait for every queued show to be fetched
+                raise
+        self.elapsed = time.perf_counter() - start
+        return out
+
+    def stop(self) -> None:
+        self.stopped.set()
+
+    def report(self) -> str:
+        if len(self.latencies) == 0:
+            return f"Refreshed 0 shows{f', {len(self.failed)} failed' if len(self.failed) > 0 else ''}."
+        latencies = sorted(self.latencies)
+        average = sum(latencies) / len(latencies) * 1000
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000
+        return (f"Refreshed {len(latencies)} shows in {self.elapsed:.2f}s ({len(latencies) / self.elapsed:.1f} shows/s) | "
+                f"latency avg {average:.0f}ms, p95 {p95:.0f}ms, max {latencies[-1] * 1000:.0f}ms"
+                f"{f' | {len(self.failed)} failed' if len(self.failed) > 0 else ''}")
+
+
+class ListStore:
+    db: sqlite3.Connection
+    lock: Lock      # the store can get written to from worker threads
+
+    def __init__(self, path: str) -> None:
+        self.db = sqlite3.connect(path, isolation_level=None, check_same_thread=False)   # autocommit, every change is written as it happens
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS shows (id INTEGER PRIMARY KEY, is_completed INTEGER, data BLOB)")
+        self.lock = Lock()
+
+    def load(self, completed: 'bool | None' = None) -> 'list[Show]':
+        # completed=True/False only loads finished/airing shows, None loads everything
+        query = "SELECT data FROM shows" if completed is None else "SELECT data FROM shows WHERE is_completed = ?"
+        start = time.perf_counter()
+        with self.lock:
+            rows = self.db.execute(query, () if completed is None else (int(completed),)).fetchall()
+        shows = [pickle.loads(row[0]) for row in rows]
+        if METRICS.enabled:
+            METRICS.observe("list_store_load_seconds", time.perf_counter() - start)
+            METRICS.count("list_store_loaded_shows_total", len(shows))
+            METRICS.count("list_store_read_bytes_total", sum(len(row[0]) for row in rows))
+        return shows
+
+    def save(self, shows: 'list[Show]') -> None:
+        # adds or updates the given shows in one transaction
+        start = time.perf_counter()
+        rows = [(show.id, int(show.is_completed), pickle.dumps(show, pickle.HIGHEST_PROTOCOL)) for show in shows]
+        with self.lock:
+            with self.db:
+                self.db.execute("BEGIN")
+                self.db.executemany("INSERT OR REPLACE INTO shows VALUES (?, ?, ?)", rows)
+        if METRICS.enabled:
+            METRICS.observe("list_store_save_seconds", time.perf_counter() - start)
+            METRICS.count("list_store_saved_shows_total", len(rows))
+            METRICS.count("list_store_written_bytes_total", sum(len(row[2]) for row in rows))
+
+    def remove(self, show: 'Show') -> None:
+        with self.lock:
+            self.db.execute("DELETE FROM shows WHERE id = ?", (show.id,))
+
+    def count(self) -> int:
+        with self.lock:
+            return self.db.execute("SELECT COUNT(*) FROM shows").fetchone()[0]
+
+    def ids(self) -> 'set[int]':
+        with self.lock:
+            return {row[0] for row in self.db.execute("SELECT id FROM shows")}
+
+    def migrate(self, pickle_file: str) -> int:
+        # one time import of the old whole-list pickle cache, it gets renamed afterwards so it isn't imported twice
+        if not os.path.exists(pickle_file):
+            return 0
+        with open(pickle_file, "rb") as f:
+            shows = pickle.load(f)
+        self.save(shows)
+        os.replace(pickle_file, pickle_file + ".migrated")
+        return len(shows)
+
+    def close(self) -> None:
+        with self.lock:
+            self.db.close()
+
+
+class Scheduler:
+    main: 'Main'
+    interval: float                 # seconds between refresh rounds, also how old an airing show's data can get
+    stopped: Event
+    thread: 'Thread | None'
+    refresher: 'Refresher | None'   # the round that's running, so stop() can cancel it
+    SEASONS = {"winter": 0, "spring": 1, "summer": 2, "fall": 3}
+
+    def __init__(self, main: 'Main', interval: float = 3600) -> None:
+        self.main = main
+        self.interval = interval
+        self.stopped = Event()
+        self.thread = None
+        self.refresher = None
+
+    @classmethod
+    def priority(cls, show: Show) -> tuple:
+        # airing shows first, then the most recent seasons, then whichever was refreshed the longest ago
+        season, _, year = show.start_season.partition(" ")
+        recency = int(year) * 4 + cls.SEASONS.get(season, 0) if year.isdigit() else 0
+        return (show.is_completed, -recency, show.fetched_at)
+
+    def run_once(self) -> Refresher:
+        # the MAL client's rate limiter is shared with everything else, so this never goes over the limit. the response
+        # cache keeps airing shows for longer than a round, so skip it or we'd just reload the same data every round
+        stale = sorted(self.main.find_stale(self.interval), key=self.priority)
+        self.refresher = Refresher(self.main.mal_client, cached=False)
+        if self.stopped.is_set():
+            self.refresher.stop()
+        self.refresher.refresh(stale, done=lambda show: self.main.apply([show]))
+        return self.refresher
+
+    def run(self, quiet: bool = True) -> None:
+        while not self.stopped.is_set():
+            refresher = self.run_once()
+            if not quiet:
+                print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] {refresher.report()}", flush=True)
+            METRICS.dump()  # keeps the metrics file current while the daemon runs
+            self.stopped.wait(self.interval)
+
+    def start(self) -> None:
+        # refresh in the background while the user works with the cached data
+        self.thread = Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self) -> None:
+        self.stopped.set()
+        if self.refresher is not None:
+            self.refresher.stop()
+        if self.thread is not None:
+            self.thread.join()
 
 
 class Main:
-    CACHE_FILE: str
-    qb_client: qbittorrentapi.Client
+    LIST_FILE: str
+    store: ListStore
+    index: SearchIndex      # kept up to date with self.shows, used by every command that searches the list
+    positions: 'dict[int, int]'     # show id -> index in self.shows
+    lock: Lock              # guards self.shows, self.positions and self.index, the scheduler updates them in the background
+    scheduler: 'Scheduler | None'
+    qb_client: 'qbittorrentapi.Client | None'   # connected the first time a qBittorrent command is used
     mal_client: MAL
     commands: dict = {}
     shows: 'list[Show]' = []
     QBITTORRENT: bool = True
+    QUIET: bool = False
 
-    def __init__(self, cache_file: str, client: MAL) -> None:
-        self.CACHE_FILE = cache_file
+    def __init__(self, list_file: str, client: MAL, legacy_cache_file: str = LEGACY_CACHE_FILE, qbittorrent: bool = True, quiet: bool = False) -> None:
+        # quiet keeps status messages off stdout, eg for machine readable output
+        self.LIST_FILE = list_file
+        self.QUIET = quiet
         self.mal_client = client
+        self.lock = Lock()
+        self.scheduler = None
+        self.store = ListStore(list_file)
+        migrated = self.store.migrate(legacy_cache_file)
+        if migrated > 0 and not quiet:
+            print(f"Migrated {migrated} shows from '{legacy_cache_file}' to '{list_file}'.")
         self.commands = {"sm": self.cmd_search_mal,
                          "al": self.cmd_add_to_list,
                          "ad": self.cmd_add_to_list_direct,
@@ -216,67 +1192,133 @@ class Main:
                          "sl": self.cmd_search_list,
                          "cl": self.cmd_check_list,
                          "re": self.cmd_refresh_list,
+                         "sy": self.cmd_sync_list,
                          "vd": self.cmd_view_details,
+                         "vf": self.cmd_view_franchise,
                          "qb": self.cmd_search_qbittorrent,
                          "qbd": self.cmd_search_qbittorrent_direct,
+                         "qbb": self.cmd_search_qbittorrent_batch,
+                         "stats": self.cmd_stats,
                          "h": self.cmd_help,
                          "?": self.cmd_help}
 
+        self.QBITTORRENT = qbittorrent
+        self.qb_client = None
+        for i in ("qb", "qbd", "qbb"):
+            self.commands[i] = self.with_qbittorrent(self.commands[i])
+
+        self.load_list()
+
+    def connect_qbittorrent(self) -> bool:
         # init qbittorrent api client: https://qbittorrent-api.readthedocs.io/en/latest/
         # requires these environment variables to be set:
         # QBITTORRENTAPI_USERNAME=your_username
         # QBITTORRENTAPI_PASSWORD=your_password
         # QBITTORRENTAPI_HOST=qbittorrent_server_ip:port
-        try:
-            self.qb_client = qbittorrentapi.Client()
-            self.qb_client.auth_log_in()
-        except (requests.exceptions.InvalidURL, qbittorrentapi.exceptions.APIConnectionError):
-            self.QBITTORRENT = False
-            print("qBittorrent server not found, check your environment variables.")
-        if not self.QBITTORRENT:
-            self.commands["qb"] = lambda: print("qBittorrent server not found, check your environment variables.")
+        # this only happens the first time it's needed, so sessions that never touch torrents don't wait on the login
+        if self.QBITTORRENT and self.qb_client is None:
+            try:
+                client = qbittorrentapi.Client()
+                client.auth_log_in()
+                self.qb_client = client
+            except (requests.exceptions.InvalidURL, qbittorrentapi.exceptions.APIConnectionError):
+                self.QBITTORRENT = False
+        return self.QBITTORRENT
 
-        self.load_list()
+    def with_qbittorrent(self, command: 'Callable[[], None]') -> 'Callable[[], None]':
+        def run() -> None:
+            if self.connect_qbittorrent():
+                command()
+            else:
+                print("qBittorrent server not found, check your environment variables.")
+        return run
 
     def main(self) -> None:
+        self.scheduler = Scheduler(self)
+        self.scheduler.start()
         while True:
             try:
                 self.commands[input(">>> ").lower()]()
             except KeyError:
                 print("Invalid command. Type 'h' or '?' to get help.")
             except KeyboardInterrupt:
+                self.scheduler.stop()
                 self.save_list()
                 break
 
-        if self.QBITTORRENT:
+        if self.qb_client is not None:
             self.qb_client.auth_log_out()    # make sure we log out of our qBittorrent session
 
     def load_list(self) -> None:
-        try:
-            with open(self.CACHE_FILE, "rb") as f:
-                self.shows += pickle.load(f)     # load cached shows (ie shows that have finished airing)
+        # only loads what's saved, refreshing happens in the background (see Scheduler) or with 'sy'/'re'
+        start = time.perf_counter()
+        self.shows = Show.sort(self.store.load())
+        self.positions = {self.shows[i].id: i for i in range(len(self.shows))}
+        self.index = SearchIndex(self.shows)
+        if METRICS.enabled:
+            METRICS.observe("list_load_seconds", time.perf_counter() - start)    # loading, sorting and indexing
+        if self.QUIET:
+            pass
+        elif len(self.shows) > 0:
             print(f"Loaded {len(self.shows)} cached shows.")
-        except FileNotFoundError:
-            print("No cache file found. If this isn't your first run of the script, make sure you're in the right directory.")
+        else:
+            print("No saved shows found. If this isn't your first run of the script, make sure you're in the right directory.")
 
-        x = LoadingBar("Refreshing data from myanimelist.net for non 'finished airing' shows... ", len([i for i in self.shows if not i.is_completed]))
+    def find_stale(self, max_age: float = 0) -> 'list[Show]':
+        # pulls the user's MAL list (a few requests no matter how long it is) and finds the shows whose entry, score
+        # or episode count changed since we last got them. shows that aren't on the MAL list count as stale if they're still airing and
+        # their data is older than max_age seconds
+        try:
+            remote = self.mal_client.get_user_list()
+        except (requests.exceptions.RequestException, KeyError, ValueError):
+            remote = {}
+            print("Couldn't get your list from myanimelist.net, refreshing every airing show instead.", file=sys.stderr)
+        now = time.time()
+        stale = []
+        for show in list(self.shows):
+            node = remote.get(show.id)
+            if node is None:
+                if not show.is_completed and now - show.fetched_at >= max_age:
+                    stale.append(show)  # cached data is still fine if it's fresh enough
+            elif show.outdated(node):
+                self.mal_client.forget(show.id)
+                stale.append(show)
+        return stale
+
+    def apply(self, shows: 'list[Show]') -> None:
+        # swap refreshed shows into the list, shows removed in the meantime are ignored
+        with self.lock:
+            applied = []
+            for show in shows:
+                position = self.positions.get(show.id)
+                if position is not None:
+                    self.shows[position] = show
+                    self.index.add(show)
+                    applied.append(show)
+            self.store.save(applied)
+
+    def sync_list(self) -> 'list[Show]':
+        # only refetches shows that changed on MAL or are still airing, returns the refreshed shows
+        stale = self.find_stale()
+        print(f"{len(stale)} of {len(self.shows)} shows need refreshing.")
+        refresher = Refresher(self.mal_client)
+        x = LoadingBar("Refreshing data from myanimelist.net for changed and airing shows... ", len(stale))
         x.start()
-        for i in range(len(self.shows)):
-            show = self.shows[i]
-            if not show.is_completed:   # if show isn't finished airing, refresh its data
-                self.shows[i] = Show(show.id, self.mal_client)
-                x.update()
-        self.shows = sorted(self.shows)
+        refreshed = refresher.refresh(stale, x)
         x.stop()
+        self.apply(refreshed)
+        print(refresher.report())
+        return refreshed
 
     def save_list(self) -> None:
-        with open(self.CACHE_FILE, "wb") as f:
-            pickle.dump(self.shows, f)   # cache shows
-        print(f"\nCached {len(self.shows)} shows.")
+        # every change is already in the store by now, so just make sure it's closed cleanly
+        self.store.close()
+        print(f"\nSaved {len(self.shows)} shows.")
 
-    def search_list(self) -> 'list[Show]':
-        query = input("Enter your search query: ").lower()
-        return [show for show in self.shows if query in str(show).lower()]
+    def search_list(self, prompt: str = "Enter your search query: ") -> 'list[Show]':
+        query = input(prompt)
+        with self.lock:
+            return self.index.search(query)
 
     def cmd_search_mal(self) -> None:
         self.mal_client.search_mal(input("Search MAL; enter your search query: "))
@@ -290,7 +1332,11 @@ class Main:
                 if i.id == show.id:
                     print(f"'{show.name}' already in list, cancelling.")
                     return
-            self.shows.append(show)
+            with self.lock:
+                self.positions[show.id] = len(self.shows)
+                self.shows.append(show)
+                self.index.add(show)
+                self.store.save([show])
             print(f"Added '{show.name}' to list.")
 
     def cmd_add_to_list_direct(self) -> None:
@@ -301,7 +1347,11 @@ class Main:
                 if i.id == show.id:
                     print(f"'{show.name}' already in list, cancelling.")
                     return
-            self.shows.append(show)
+            with self.lock:
+                self.positions[show.id] = len(self.shows)
+                self.shows.append(show)
+                self.index.add(show)
+                self.store.save([show])
             print(f"Added '{show.name}' to list.")
 
     def cmd_remove_from_list(self) -> None:
@@ -310,27 +1360,36 @@ class Main:
             print(f"  [{i}] : {shows[i]}")
         index = get_int_input("What index do you want to remove? ", True)
         if index != CANCELLED:
-            show = shows[index]
-            self.shows.remove(show)
+            # go by id, the scheduler may have swapped in a refreshed copy of the show while we waited for the index
+            with self.lock:
+                position = self.positions.get(shows[index].id)
+                if position is None:
+                    print(f"'{shows[index].name}' isn't in your list anymore.")
+                    return
+                show = self.shows.pop(position)
+                self.positions = {self.shows[i].id: i for i in range(len(self.shows))}
+                self.index.remove(show)
+                self.store.remove(show)
             print(f"Removed '{show.name}' from list.")
 
     def cmd_search_list(self) -> None:
-        query = input("Search list; enter your search query: ").lower()
-        for show in self.shows:
-            if query in str(show).lower():
-                print(show)
+        for show in self.search_list("Search list; enter your search query: "):
+            print(show)
 
     def cmd_check_list(self) -> None:
         print('\n'.join([str(i) for i in self.shows]))
 
     def cmd_refresh_list(self) -> None:
+        refresher = Refresher(self.mal_client, cached=False)
         x = LoadingBar("Refreshing data from myanimelist.net for your list... ", len(self.shows))
         x.start()
-        for i in range(len(self.shows)):
-            show = self.shows[i]
-            self.shows[i] = Show(show.id, self.mal_client)
-            x.update()
+        refreshed = refresher.refresh(list(self.shows), x)
         x.stop()
+        self.apply(refreshed)
+        print(refresher.report())
+
+    def cmd_sync_list(self) -> None:
+        self.sync_list()
 
     def cmd_view_details(self) -> None:
         shows = self.search_list()
@@ -339,8 +1398,20 @@ class Main:
         index = get_int_input("What index do you want to view details for? ", True)
         if index != CANCELLED:
             show = shows[index]
+            show.get_related(self.mal_client)
             print(f"{show}{show.related_shows_to_str()}")
 
+    def cmd_view_franchise(self) -> None:
+        shows = self.search_list()
+        for i in range(len(shows)):
+            print(f"  [{i}] : {shows[i]}")
+        index = get_int_input("What index do you want to view the franchise for? ", True)
+        if index != CANCELLED:
+            show = shows[index]
+            depth = get_int_input("How many relations deep should we go? ", True)
+            if depth != CANCELLED:
+                print(f"{show}\n  " + '\n  '.join([str(i) for i in self.mal_client.get_franchise(show, depth)]))
+
     def cmd_search_qbittorrent(self) -> None:
         shows = self.search_list()
         finished = [show for show in shows if show.is_completed]
@@ -350,31 +1421,28 @@ class Main:
         if index != CANCELLED:
             show = finished[index]
             query = input("Additional search query (eg `judas`, `batch`, etc): ")
-            job = self.qb_client.search_start(f"{show.name}{' ' + query if len(query) > 0 else ''}", "nyaasi", "anime")
-            x = LoadingBar("Searching with qBittorrent... ")
-            x.start()
-            while job.status()[0]["status"] == "Running":
-                pass
-            x.stop()
-            torrents = sorted([Torrent(i) for i in job.results()["results"]])    # sort by number of seeders
-            for i in range(10 if len(torrents) >= 10 else len(torrents)):
-                print(f"  [{i}] : {torrents[i]}")
-            index = get_int_input("What index do you want to download with qBittorrent? ", True)
-            if index != CANCELLED:
-                torrent = torrents[index]
-                self.qb_client.torrents.add([torrent.file_url])
-                print("Torrent added successfully.")
+            self.search_qbittorrent(f"{show.name}{' ' + query if len(query) > 0 else ''}", "nyaasi", "anime")
 
     def cmd_search_qbittorrent_direct(self) -> None:
-        query = input("Search qbittorrent, enter your query: ")
-        job = self.qb_client.search_start(query, "all", "all")
-        x = LoadingBar("Searching with qBittorrent... ")
-        x.start()
-        while job.status()[0]["status"] == "Running":
-            pass
-        x.stop()
-        torrents = sorted([Torrent(i) for i in job.results()["results"]])
-        for i in range(10 if len(torrents) >= 10 else len(torrents)):
+        self.search_qbittorrent(input("Search qbittorrent, enter your query: "), "all", "all")
+
+    def search_qbittorrent(self, query: str, plugins: str, category: str) -> None:
+        search = TorrentSearch(self.qb_client, query, plugins, category)
+        ranker = TorrentRanker(10)  # by number of seeders
+        results = search.results()
+        try:
+            # show the best torrent found so far while we wait, ctrl+c stops the search early and keeps what we have
+            # (results() handles ctrl+c itself while it's waiting on qBittorrent, this is for one that comes in here)
+            for batch in results:
+                ranker.add(batch)
+                print(f"\r Searching with qBittorrent (ctrl+c to stop early)... {search.received} results, best: {ranker.best()}", end="", flush=True)
+        except KeyboardInterrupt:
+            search.cancel()
+            for batch in results:
+                ranker.add(batch)
+        print()
+        torrents = ranker.top()
+        for i in range(len(torrents)):
             print(f"  [{i}] : {torrents[i]}")
         index = get_int_input("What index do you want to download with qBittorrent? ", True)
         if index != CANCELLED:
@@ -382,6 +1450,67 @@ class Main:
             self.qb_client.torrents.add([torrent.file_url])
             print("Torrent added successfully.")
 
+    def cmd_search_qbittorrent_batch(self) -> None:
+        shows = [show for show in self.search_list("Batch search qBittorrent; filter your list (leave empty for all): ") if show.is_completed]
+        if len(shows) == 0:
+            print("No finished shows matched.")
+            return
+        query = input(f"Searching for {len(shows)} finished shows. Additional search query (eg `judas`, `batch`, etc): ")
+        results = self.batch_search_qbittorrent(shows, query, "nyaasi", "anime")
+        best = []
+        for show in shows:
+            torrents = results[show.id]
+            print(show)
+            if len(torrents) == 0:
+                print("    no results")
+                continue
+            for torrent in torrents[:3]:
+                print(f"    {torrent}")
+            best.append(torrents[0])
+        if len(best) > 0 and input(f"Add the top torrent for {len(best)} shows to qBittorrent? (y/n) ").lower() == "y":
+            self.qb_client.torrents.add(urls=[torrent.file_url for torrent in best])
+            print(f"Added {len(best)} torrents.")
+
+    def batch_search_qbittorrent(self, shows: 'list[Show]', query: str, plugins: str, category: str, max_jobs: int = 5) -> 'dict[int, list[Torrent]]':
+        # runs up to max_jobs searches at once (qBittorrent itself only runs 5 at a time by default),
+        # returns each show's results best first: most seeders, then the bigger torrent
+        searches = {show.id: TorrentSearch(self.qb_client, f"{show.name}{' ' + query if len(query) > 0 else ''}", plugins, category) for show in shows}
+
+        def search(show: Show) -> 'list[Torrent]':
+            ranker = TorrentRanker(3, [TorrentRanker.seeders, TorrentRanker.size])
+            for batch in searches[show.id].results():
+                ranker.add(batch)
+            return ranker.top()
+
+        results = {show.id: [] for show in shows}   # shows whose search failed or never started have no results
+        x = LoadingBar("Searching with qBittorrent... ", len(shows))
+        x.start()
+        with ThreadPoolExecutor(max_jobs) as pool:
+            futures = {pool.submit(search, show): show for show in shows}
+            try:
+                for future in as_completed(futures):
+                    x.update()
+            except KeyboardInterrupt:
+                # ctrl+c stops the whole batch, searches that already started still return what they found so far
+                for future in futures:
+                    future.cancel()
+                for i in searches.values():
+                    i.cancel()
+        x.stop()
+        for future, show in futures.items():
+            if not future.cancelled():
+                try:
+                    results[show.id] = future.result()
+                except qbittorrentapi.exceptions.APIError:
+                    pass
+        return results
+
+    def cmd_stats(self) -> None:
+        print(METRICS.report())
+        if self.mal_client.cache is not None:
+            print(self.mal_client.cache.report())
+        METRICS.dump()
+
     def cmd_help(self) -> None:
         print("Commands are listed here:" +
               "\n  sm : Search MAL directly" +
@@ -389,10 +1518,15 @@ class Main:
               "\n  ad : Add directly via anime id on MAL (use if search isn't working)" +
               "\n  rl : Remove a show from your list" +
               "\n  re : Refetch data for the whole list" +
-              "\n  sl : Search your list" +
+              "\n  sy : Refetch data only for shows that changed on MAL (and airing shows not on your MAL list)" +
+              "\n  sl : Search your list (narrow it down with `name:`, `genre:` or `season:`, eg `genre:action season:spring 2024`)" +
               "\n  cl : Check status of your list" +
               "\n  vd : View a specific anime in more detail" +
-              "\n  qb : Search qBittorrent for torrent links")
+              "\n  vf : View the franchise (related anime of related anime, etc) of a specific anime" +
+              "\n  qb : Search qBittorrent for torrent links" +
+              "\n  qbd : Search qBittorrent directly with your own query" +
+              "\n  qbb : Search qBittorrent for every finished show matching a filter and add the best torrents in one go" +
+              "\n  stats : Show request latencies, cache hit rates etc (needs `--metrics`)")
 
 
 def get_int_input(msg: str, cancellable: bool = False) -> int:
@@ -408,5 +1542,130 @@ def get_int_input(msg: str, cancellable: bool = False) -> int:
     return x
 
 
+#################################
+# Command Line                  #
+#################################
+
+
+def print_shows(shows: 'list[Show]', as_json: bool) -> None:
+    for show in shows:
+        print(json.dumps(show.to_json(), ensure_ascii=False) if as_json else show, flush=True)
+
+
+def open_store(create: bool = False) -> ListStore:
+    # same as starting the interactive prompt: an old cache.bin gets migrated first. commands that only read the list
+    # don't create an empty one when they're run from the wrong directory
+    if not create and not os.path.exists(LIST_FILE) and not os.path.exists(LEGACY_CACHE_FILE):
+        sys.exit(f"No saved shows found ('{LIST_FILE}' or '{LEGACY_CACHE_FILE}'), make sure you're in the right directory.")
+    store = ListStore(LIST_FILE)
+    migrated = store.migrate(LEGACY_CACHE_FILE)
+    if migrated > 0:
+        print(f"Migrated {migrated} shows from '{LEGACY_CACHE_FILE}' to '{LIST_FILE}'.", file=sys.stderr)
+    return store
+
+
+def cli_check(args: argparse.Namespace) -> None:
+    store = open_store()
+    print_shows(Show.sort(store.load(None if args.status == "all" else args.status == "finished")), args.json)
+
+
+def cli_search(args: argparse.Namespace) -> None:
+    print_shows(SearchIndex(Show.sort(open_store().load())).search(args.query), args.json)
+
+
+def cli_search_mal(args: argparse.Namespace) -> None:
+    print_shows(MAL(TOKEN_FILE).search_mal(args.query, args.limit, args.pages, False), args.json)
+
+
+def cli_add_ids(args: argparse.Namespace) -> None:
+    # one id per line, shows already in the list are skipped. added shows are printed as soon as they're fetched
+    ids = []
+    with (sys.stdin if args.file == "-" else open(args.file)) as f:
+        for number, line in enumerate(f, 1):
+            if line.strip() == "":
+                continue
+            try:
+                ids.append(int(line))
+            except ValueError:
+                sys.exit(f"Line {number} isn't a MAL id: {line.strip()!r}")
+    store = open_store(create=True)
+    existing = store.ids()
+    ids = [id for id in dict.fromkeys(ids) if id not in existing]
+    refresher = Refresher(MAL(TOKEN_FILE, cache=ResponseCache(RESPONSE_CACHE_FILE)))
+
+    def added(show: Show) -> None:
+        store.save([show])
+        print_shows([show], args.json)
+    refresher.get(ids, done=added)
+    store.close()
+    exit_if_failed(refresher)
+
+
+def cli_sync(args: argparse.Namespace) -> None:
+    open_store().close()    # exits instead of creating an empty list in the wrong directory, and migrates cache.bin
+    main = Main(LIST_FILE, MAL(TOKEN_FILE, cache=ResponseCache(RESPONSE_CACHE_FILE)), LEGACY_CACHE_FILE, qbittorrent=False, quiet=True)
+    refresher = Refresher(main.mal_client)
+
+    def refreshed(show: Show) -> None:
+        main.apply([show])
+        print_shows([show], args.json)
+    refresher.get([show.id for show in main.find_stale()], done=refreshed)
+    main.store.close()
+    exit_if_failed(refresher)
+
+
+def exit_if_failed(refresher: Refresher) -> None:
+    if len(refresher.failed) > 0:
+        print(f"Couldn't get {len(refresher.failed)} ids: {', '.join(str(i) for i in refresher.failed)}", file=sys.stderr)
+        sys.exit(1)
+
+
+def cli_daemon(args: argparse.Namespace) -> None:
+    # headless: keep the list refreshed on an interval until ctrl+c
+    main = Main(LIST_FILE, MAL(TOKEN_FILE, cache=ResponseCache(RESPONSE_CACHE_FILE)), LEGACY_CACHE_FILE, qbittorrent=False)
+    try:
+        Scheduler(main, args.interval).run(quiet=False)
+    except KeyboardInterrupt:
+        main.save_list()
+
+
+def cli_interactive(args: argparse.Namespace) -> None:
+    Main(LIST_FILE, MAL(TOKEN_FILE, cache=ResponseCache(RESPONSE_CACHE_FILE)), LEGACY_CACHE_FILE).main()
+
+
+def get_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Bulk check whether the anime on your list have finished airing. Run without a command for the interactive prompt.")
+    parser.set_defaults(func=cli_interactive)
+    parser.add_argument("--metrics", action="store_true", help="collect request latencies, cache hit rates etc, see the `stats` command")
+    parser.add_argument("--metrics-file", help="also write the metrics to this file on exit (and after every daemon round), "
+                                               "as JSON if it ends in .json and in the Prometheus text format otherwise")
+    subparsers = parser.add_subparsers(dest="command")
+    parser_check = subparsers.add_parser("check", help="print your list")
+    parser_check.add_argument("--status", choices=["all", "finished", "airing"], default="all")
+    parser_search = subparsers.add_parser("search", help="search your list, same syntax as the `sl` command")
+    parser_search.add_argument("query")
+    parser_search_mal = subparsers.add_parser("search-mal", help="search myanimelist.net")
+    parser_search_mal.add_argument("query")
+    parser_search_mal.add_argument("--limit", type=int, default=10, help="results per page")
+    parser_search_mal.add_argument("--pages", type=int, default=1)
+    parser_add_ids = subparsers.add_parser("add-ids", help="add shows by MAL id, one per line")
+    parser_add_ids.add_argument("file", help="file with the ids, or - for stdin")
+    parser_sync = subparsers.add_parser("sync", help="refresh the shows that changed on MAL or are still airing, prints the refreshed shows")
+    parser_daemon = subparsers.add_parser("daemon", help="keep refreshing your list on an interval without the interactive prompt")
+    parser_daemon.add_argument("interval", type=float, nargs="?", default=3600, help="seconds between refreshes (default: hourly)")
+    for subparser, func in [(parser_check, cli_check), (parser_search, cli_search), (parser_search_mal, cli_search_mal),
+                            (parser_add_ids, cli_add_ids), (parser_sync, cli_sync)]:
+        subparser.add_argument("--json", action="store_true", help="print one JSON object per show instead")
+        subparser.set_defaults(func=func)
+    parser_daemon.set_defaults(func=cli_daemon)
+    return parser
+
+
 if __name__ == "__main__":
-    Main("cache.bin", MAL("secret_token.json")).main()
+    args = get_parser().parse_args()
+    METRICS.enabled = args.metrics or args.metrics_file is not None
+    METRICS.path = args.metrics_file
+    try:
+        args.func(args)
+    finally:
+        METRICS.dump()